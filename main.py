@@ -1,178 +1,182 @@
-import requests
+import string
+import orjson
 import pandas as pd
+import requests
 import streamlit as st
-from typing import Any, Dict, List, Union, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from shipstream_core import (
+    CACHE_MAX_ENTRIES,
+    CACHE_TTL,
+    ShipstreamAPIError,
+    build_url,
+    count_list,
+    fetch_shipment,
+    fmt_weight,
+    get_auth_token,
+    get_first_shipment,
+    get_links,
+    prefetch_neighbors,
+    prune_http_cache,
+    ref_id,
+)
 
 # =========================
 # Config
 # =========================
-API_BASE = "https://app.buhologistics.com/api/global/beta/shipments/"
-API_VERSION = "2020-10"
-
-# Fallback local (idealmente NO lo dejes en repo público)
-DEFAULT_AUTH = ""
-
-
-
-# =========================
-# Helpers de API
-# =========================
-def build_url(unique_id: str) -> str:
-    unique_id = str(unique_id).strip()
-    return f"{API_BASE}?filter[]=unique_id:{unique_id}&expand=order"
-
-
-def get_auth_token() -> str:
-    try:
-        return st.secrets.get("SHIPSTREAM_AUTH", DEFAULT_AUTH)  # type: ignore
-    except Exception:
-        return DEFAULT_AUTH
-
-
-def get_headers(auth_token: str) -> Dict[str, str]:
-    return {
-        "Content-Type": "application/json",
-        "X-ShipStream-API-Version": API_VERSION,
-        "X-AutomationV1-Auth": auth_token.strip(),
-    }
-
-
-def safe_json(response: requests.Response) -> Union[Dict[str, Any], List[Any], str]:
-    try:
-        return response.json()
-    except Exception:
-        return response.text
-
-
-# =========================
-# Helpers de parsing
-# =========================
-def get_first_shipment(data: Any) -> Optional[Dict[str, Any]]:
-    if isinstance(data, dict):
-        col = data.get("collection")
-        if isinstance(col, list) and col:
-            first = col[0]
-            if isinstance(first, dict):
-                return first
-    return None
-
-
-def fmt_weight(w: Any) -> str:
-    if isinstance(w, dict):
-        val = w.get("value", "")
-        unit = w.get("unit", "")
-        if val == "" and unit == "":
-            return ""
-        return f"{val} {unit}".strip()
-    return str(w or "")
-
-
-def count_list(x: Any) -> str:
-    if isinstance(x, list):
-        return str(len(x))
-    return "0" if x is None else str(x)
-
-
-def get_links(obj: Any) -> Dict[str, str]:
-    if isinstance(obj, dict):
-        links = obj.get("links")
-        if isinstance(links, dict):
-            # Convertimos a str por seguridad
-            return {str(k): str(v) for k, v in links.items()}
-    return {}
+# Arriba de este tamaño el JSON se muestra como texto: el árbol de st.json es lento en el navegador
+JSON_TREE_MAX_BYTES = 200_000
+
+# (Etiqueta, llave, formateador) de las tablas en limpio; None = valor tal cual
+FieldSpec = Tuple[str, str, Optional[Callable[[Any], Any]]]
+
+SHIPMENT_SCHEMA: Tuple[FieldSpec, ...] = (
+    ("ID del Envío", "id", None),
+    ("Unique ID del Envío", "unique_id", None),
+    ("Estatus del Envío", "status", None),
+    ("ID del Almacén", "warehouse", ref_id),
+    ("Método de Envío (Shipment)", "shipping_method", None),
+    ("Fecha Objetivo de Envío", "target_ship_date", None),
+    ("Peso Total", "total_weight", fmt_weight),
+    ("Peso Total de Ítems", "total_item_weight", fmt_weight),
+    ("Peso Enviado", "shipped_weight", fmt_weight),
+    ("Cantidad de Ítems del Envío", "items", count_list),
+    ("Cantidad de Paquetes", "packages", count_list),
+)
+
+ORDER_SCHEMA: Tuple[FieldSpec, ...] = (
+    ("ID de la Orden", "id", None),
+    ("Unique ID de la Orden", "unique_id", None),
+    ("Referencia de Orden", "order_ref", None),
+    ("Estado", "state", None),
+    ("Estatus", "status", None),
+    ("Carrier Code", "carrier_code", None),
+    ("Método de Envío (Order)", "shipping_method", None),
+    ("Prioridad", "priority", None),
+    ("Firma Requerida", "signature_required", None),
+    ("Entrega en Sábado", "is_saturday_delivery", None),
+    ("Requiere Overbox", "is_overbox_required", None),
+    ("Servicio de Valor Declarado", "is_declared_value_service", None),
+    ("Valor Declarado", "declared_value", None),
+    ("Cantidad de Ítems de la Orden", "items", count_list),
+    ("Cantidad de Envíos en la Orden", "shipments", count_list),
+)
 
 
 # =========================
 # Helpers de UI / formateo
 # =========================
-def pretty_table(rows: List[Dict[str, str]]) -> pd.DataFrame:
-    # Orden fijo Campo/Valor
-    return pd.DataFrame(rows, columns=["Campo", "Valor"])
-
+def md_cell(text: str) -> str:
+    # Escapa toda la puntuación ASCII: así *, _, [, $, :, etc. se muestran tal cual
+    text = text.replace("\r\n", " ").replace("\r", " ").replace("\n", " ")
+    return "".join("\\" + ch if ch in string.punctuation else ch for ch in text)
 
-def add_row(rows: List[Dict[str, str]], label: str, value: Any):
-    v = "" if value is None else str(value)
-    rows.append({"Campo": label, "Valor": v})
 
+def pretty_table(campos: List[str], valores: List[str]) -> str:
+    # Orden fijo Campo/Valor; tabla Markdown directa, sin pasar por un DataFrame
+    lines = ["| Campo | Valor |", "|---|---|"]
+    lines.extend(f"| {md_cell(c)} | {md_cell(v)} |" for c, v in zip(campos, valores))
+    return "\n".join(lines)
 
-def shipment_pretty(shipment: Dict[str, Any]) -> pd.DataFrame:
-    rows: List[Dict[str, str]] = []
 
-    add_row(rows, "ID del Envío", shipment.get("id"))
-    add_row(rows, "Unique ID del Envío", shipment.get("unique_id"))
-    add_row(rows, "Estatus del Envío", shipment.get("status"))
+def add_row(campos: List[str], valores: List[str], label: str, value: Any):
+    campos.append(label)
+    valores.append("" if value is None else str(value))
 
-    warehouse_id = (shipment.get("warehouse") or {}).get("id") if isinstance(shipment.get("warehouse"), dict) else ""
-    add_row(rows, "ID del Almacén", warehouse_id)
 
-    add_row(rows, "Método de Envío (Shipment)", shipment.get("shipping_method"))
-    add_row(rows, "Fecha Objetivo de Envío", shipment.get("target_ship_date"))
+def shipment_pretty(shipment: Dict[str, Any]) -> str:
+    campos: List[str] = []
+    valores: List[str] = []
 
-    add_row(rows, "Peso Total", fmt_weight(shipment.get("total_weight")))
-    add_row(rows, "Peso Total de Ítems", fmt_weight(shipment.get("total_item_weight")))
-    add_row(rows, "Peso Enviado", fmt_weight(shipment.get("shipped_weight")))
-
-    add_row(rows, "Cantidad de Ítems del Envío", count_list(shipment.get("items")))
-    add_row(rows, "Cantidad de Paquetes", count_list(shipment.get("packages")))
+    for label, key, fmt in SHIPMENT_SCHEMA:
+        value = shipment.get(key)
+        add_row(campos, valores, label, fmt(value) if fmt else value)
 
     # Links útiles si existen
     links = get_links(shipment)
     if links.get("order"):
-        add_row(rows, "Link del Order (API)", links.get("order"))
-
-    return pretty_table(rows)
-
-
-def order_pretty(order: Dict[str, Any]) -> pd.DataFrame:
-    rows: List[Dict[str, str]] = []
-
-    add_row(rows, "ID de la Orden", order.get("id"))
-    add_row(rows, "Unique ID de la Orden", order.get("unique_id"))
-    add_row(rows, "Referencia de Orden", order.get("order_ref"))
+        add_row(campos, valores, "Link del Order (API)", links.get("order"))
 
-    add_row(rows, "Estado", order.get("state"))
-    add_row(rows, "Estatus", order.get("status"))
+    return pretty_table(campos, valores)
 
-    add_row(rows, "Carrier Code", order.get("carrier_code"))
-    add_row(rows, "Método de Envío (Order)", order.get("shipping_method"))
 
-    add_row(rows, "Prioridad", order.get("priority"))
-    add_row(rows, "Firma Requerida", order.get("signature_required"))
-    add_row(rows, "Entrega en Sábado", order.get("is_saturday_delivery"))
-    add_row(rows, "Requiere Overbox", order.get("is_overbox_required"))
+def order_pretty(order: Dict[str, Any]) -> str:
+    campos: List[str] = []
+    valores: List[str] = []
 
-    add_row(rows, "Servicio de Valor Declarado", order.get("is_declared_value_service"))
-    add_row(rows, "Valor Declarado", order.get("declared_value"))
-
-    # Conteos útiles
-    add_row(rows, "Cantidad de Ítems de la Orden", count_list(order.get("items")))
-    add_row(rows, "Cantidad de Envíos en la Orden", count_list(order.get("shipments")))
+    for label, key, fmt in ORDER_SCHEMA:
+        value = order.get(key)
+        add_row(campos, valores, label, fmt(value) if fmt else value)
 
     # IDs relacionados si vienen
-    merchant_id = (order.get("merchant") or {}).get("id") if isinstance(order.get("merchant"), dict) else ""
-    brand_id = (order.get("brand") or {}).get("id") if isinstance(order.get("brand"), dict) else ""
+    merchant_id = ref_id(order.get("merchant"))
+    brand_id = ref_id(order.get("brand"))
     if merchant_id:
-        add_row(rows, "ID del Comercio (Merchant)", merchant_id)
+        add_row(campos, valores, "ID del Comercio (Merchant)", merchant_id)
     if brand_id:
-        add_row(rows, "ID de la Marca (Brand)", brand_id)
+        add_row(campos, valores, "ID de la Marca (Brand)", brand_id)
 
-    return pretty_table(rows)
+    return pretty_table(campos, valores)
 
 
-def merchant_pretty(merchant: Dict[str, Any]) -> pd.DataFrame:
-    rows: List[Dict[str, str]] = []
+def merchant_pretty(merchant: Dict[str, Any]) -> str:
+    campos: List[str] = []
+    valores: List[str] = []
 
-    add_row(rows, "Tipo", merchant.get("type"))
-    add_row(rows, "ID del Comercio", merchant.get("id"))
+    add_row(campos, valores, "Tipo", merchant.get("type"))
+    add_row(campos, valores, "ID del Comercio", merchant.get("id"))
 
     # Si en el futuro expandes merchant con más campos,
     # esto los mostrará de forma amistosa:
     extra_keys = [k for k in merchant.keys() if k not in {"type", "id"}]
     for k in extra_keys:
         label = str(k).replace("_", " ").strip().title()
-        add_row(rows, label, merchant.get(k))
+        add_row(campos, valores, label, merchant.get(k))
 
-    return pretty_table(rows)
+    return pretty_table(campos, valores)
+
+
+def show_json(data: Any, size: int):
+    # size = bytes del body original; solo se re-serializa si hay que mostrarlo como texto
+    if not isinstance(data, (dict, list)):
+        st.code(str(data))
+    elif size > JSON_TREE_MAX_BYTES:
+        st.code(orjson.dumps(data, option=orjson.OPT_INDENT_2).decode(), language="json")
+    else:
+        st.json(data)
+
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def build_summary_tables(shipment_id: str, shipment_json: str) -> Dict[str, Optional[str]]:
+    # La llave es el JSON serializado: Streamlit lo hashea como str, sin recorrer dicts anidados.
+    # Devuelve el Markdown ya armado para no re-serializar las tablas en cada rerun.
+    shipment = orjson.loads(shipment_json)
+    order = shipment.get("order") if isinstance(shipment.get("order"), dict) else {}
+    merchant = order.get("merchant") if isinstance(order.get("merchant"), dict) else {}
+    return {
+        "shipment": shipment_pretty(shipment),
+        "order": order_pretty(order),
+        "merchant": merchant_pretty(merchant) if merchant else None,
+    }
+
+
+def show_cache_stats():
+    try:
+        from streamlit.runtime.caching import get_data_cache_stats_provider
+    except ImportError:
+        st.caption("Esta versión de Streamlit no expone estadísticas de caché.")
+        return
+    stats = get_data_cache_stats_provider().get_stats()
+    if not stats:
+        st.caption("Sin entradas en caché.")
+        return
+    st.dataframe(
+        pd.DataFrame({
+            "Caché": [s.cache_name for s in stats],
+            "Bytes": [s.byte_length for s in stats],
+        }),
+        hide_index=True,
+    )
 
 
 # =========================
@@ -183,6 +187,9 @@ st.set_page_config(page_title="Shipstream - Shipment Info", layout="wide")
 st.title("📦 Shipstream - Consulta de Shipment por unique_id")
 st.caption("Muestra Envío, Orden y Comercio en limpio, y después el JSON completo.")
 
+with st.sidebar.expander("Cache stats"):
+    show_cache_stats()
+
 unique_id = st.text_input("unique_id")
 go = st.button("Consultar")
 
@@ -197,11 +204,13 @@ if go:
         st.stop()
 
     url = build_url(unique_id)
-    headers = get_headers(auth_token)
 
     with st.spinner("Consultando API..."):
         try:
-            resp = requests.get(url, headers=headers, timeout=30)
+            status_code, data, size = fetch_shipment(unique_id.strip(), auth_token)
+        except ShipstreamAPIError as e:
+            # Los errores no se cachean: el siguiente clic vuelve a consultar
+            status_code, data, size = e.status_code, e.data, e.size
         except requests.exceptions.RequestException as e:
             st.error(f"Error de red/requests: {e}")
             st.stop()
@@ -210,18 +219,15 @@ if go:
     st.code(url)
 
     st.caption("Status code:")
-    st.write(resp.status_code)
+    st.write(status_code)
 
-    data = safe_json(resp)
-
-    if resp.status_code >= 400:
+    if status_code >= 400:
         st.error("La API respondió con error.")
-        if isinstance(data, (dict, list)):
-            st.json(data)
-        else:
-            st.code(str(data))
+        show_json(data, size)
         st.stop()
 
+    prefetch_neighbors(unique_id.strip(), auth_token)
+
     # =========================
     # Secciones en limpio
     # =========================
@@ -232,31 +238,34 @@ if go:
     if not shipment:
         st.warning("No se encontró información dentro de 'collection'.")
     else:
-        order = shipment.get("order") if isinstance(shipment.get("order"), dict) else {}
-        merchant = order.get("merchant") if isinstance(order.get("merchant"), dict) else {}
+        tables = build_summary_tables(
+            str(shipment.get("id")),
+            orjson.dumps(shipment, option=orjson.OPT_SORT_KEYS).decode(),
+        )
 
         c1, c2, c3 = st.columns(3)
 
         with c1:
             st.markdown("### Envío")
-            st.table(shipment_pretty(shipment))
+            st.markdown(tables["shipment"])
 
         with c2:
             st.markdown("### Orden")
-            st.table(order_pretty(order))
+            st.markdown(tables["order"])
 
         with c3:
             st.markdown("### Comercio (Merchant)")
-            if merchant:
-                st.table(merchant_pretty(merchant))
+            if tables["merchant"] is not None:
+                st.markdown(tables["merchant"])
             else:
                 st.info("No viene información de merchant en el objeto order.")
 
     # =========================
     # JSON crudo completo
     # =========================
+    # Colapsado por defecto: el árbol solo se arma en el navegador al abrirlo
     st.subheader("JSON completo")
-    if isinstance(data, (dict, list)):
-        st.json(data)
-    else:
-        st.code(str(data))
+    with st.expander("Ver JSON crudo", expanded=False):
+        show_json(data, size)
+
+    prune_http_cache()
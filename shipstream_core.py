@@ -0,0 +1,198 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import orjson
+import requests
+import streamlit as st
+from datetime import timedelta
+from requests.adapters import HTTPAdapter
+from requests_cache import CachedSession
+from typing import Any, Dict, List, Union, Optional, Tuple
+from urllib3.util.retry import Retry
+
+# =========================
+# Config
+# =========================
+API_BASE = "https://app.buhologistics.com/api/global/beta/shipments/"
+API_VERSION = "2020-10"
+
+# Límites de los cachés de st.cache_data: sin ellos crecen sin tope mientras viva el worker
+CACHE_TTL = 600
+CACHE_MAX_ENTRIES = 128
+
+# Caché HTTP (requests-cache), debajo de st.cache_data. Mientras st.cache_data tenga la
+# consulta (CACHE_TTL) no hay red; al vencer, fetch_shipment llega aquí y la respuesta
+# guardada se revalida con ETag (If-None-Match), así que un 304 evita bajar el body.
+# 0 = siempre revalidar: la frescura la decide st.cache_data, no este caché.
+HTTP_CACHE_EXPIRE_AFTER = 0
+# Las respuestas se conservan varias veces CACHE_TTL para que sigan ahí al revalidar
+HTTP_CACHE_RETENTION = timedelta(seconds=6 * CACHE_TTL)
+
+# Fallback local (idealmente NO lo dejes en repo público)
+DEFAULT_AUTH = ""
+
+
+# =========================
+# Helpers de API
+# =========================
+def build_url(unique_id: str) -> str:
+    unique_id = str(unique_id).strip()
+    return f"{API_BASE}?filter[]=unique_id:{unique_id}&expand=order"
+
+
+def get_auth_token() -> str:
+    try:
+        return st.secrets.get("SHIPSTREAM_AUTH", DEFAULT_AUTH)  # type: ignore
+    except Exception:
+        return DEFAULT_AUTH
+
+
+@st.cache_resource
+def get_session() -> requests.Session:
+    # Una sola sesión por proceso: reutiliza conexiones TCP/TLS entre consultas.
+    # Además guarda respuestas y revalida con ETag (If-None-Match). SQLite en memoria:
+    # nada toca disco y, a diferencia del backend "memory", es seguro entre hilos.
+    # El token forma parte de la llave: un token distinto nunca recibe la respuesta de otro.
+    session = CachedSession(
+        backend="sqlite",
+        use_memory=True,
+        cache_control=True,
+        expire_after=HTTP_CACHE_EXPIRE_AFTER,
+        allowable_methods=("GET",),
+        match_headers=["X-AutomationV1-Auth"],
+    )
+    adapter = HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=10,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=(502, 503, 504),
+            raise_on_status=False,
+        ),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    # Headers fijos en la sesión; el token se manda por request
+    session.headers.update({
+        "Content-Type": "application/json",
+        "X-ShipStream-API-Version": API_VERSION,
+    })
+    return session
+
+
+def prune_http_cache():
+    # Acota la memoria del caché HTTP; se llama fuera de fetch_shipment para no
+    # borrar, justo antes de la consulta, la respuesta que se iba a revalidar
+    get_session().cache.delete(older_than=HTTP_CACHE_RETENTION)
+
+
+def safe_json(response: requests.Response) -> Union[Dict[str, Any], List[Any], str]:
+    # Parsea los bytes directo, sin decodificar antes a response.text
+    try:
+        return orjson.loads(response.content)
+    except orjson.JSONDecodeError:
+        return response.text
+
+
+class ShipstreamAPIError(Exception):
+    # Respuesta >= 400: se lanza para que st.cache_data no la guarde
+    def __init__(self, status_code: int, data: Union[Dict[str, Any], List[Any], str], size: int):
+        super().__init__(f"La API respondió {status_code}")
+        self.status_code = status_code
+        self.data = data
+        self.size = size
+
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def fetch_shipment(unique_id: str, auth_token: str) -> Tuple[int, Union[Dict[str, Any], List[Any], str], int]:
+    # Cacheado por (unique_id, token): los reruns de Streamlit no vuelven a pegarle a la API.
+    # Devuelve también el tamaño del body en bytes, para decidir cómo mostrar el JSON.
+    resp = get_session().get(
+        build_url(unique_id),
+        headers={"X-AutomationV1-Auth": auth_token.strip()},
+        timeout=30,
+    )
+    data = safe_json(resp)
+    size = len(resp.content)
+    if resp.status_code >= 400:
+        raise ShipstreamAPIError(resp.status_code, data, size)
+    return resp.status_code, data, size
+
+
+@st.cache_resource
+def get_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="shipstream-prefetch")
+
+
+def neighbor_ids(unique_id: str) -> List[str]:
+    # IDs consecutivos (+1/-1) respetando ceros a la izquierda; solo si es numérico
+    # isascii(): isdigit() acepta cosas como "²" que int() no puede convertir
+    if not (unique_id.isascii() and unique_id.isdigit()):
+        return []
+    n = int(unique_id)
+    width = len(unique_id) if unique_id.startswith("0") else 0
+    return [str(n + d).zfill(width) for d in (1, -1) if n + d >= 0]
+
+
+def prefetch_neighbors(unique_id: str, auth_token: str):
+    # Calienta el caché de fetch_shipment en segundo plano para la siguiente consulta.
+    # Es opcional: cualquier error se ignora para no romper el render principal
+    # (st.cache_data no guarda excepciones, así que se reintenta al consultar).
+    try:
+        executor = get_executor()
+        for neighbor in neighbor_ids(unique_id):
+            executor.submit(fetch_shipment, neighbor, auth_token)
+    except Exception:
+        pass
+
+
+# =========================
+# Helpers de parsing
+# =========================
+def get_first_shipment(data: Any) -> Optional[Dict[str, Any]]:
+    if isinstance(data, dict):
+        col = data.get("collection")
+        if isinstance(col, list) and col:
+            first = col[0]
+            if isinstance(first, dict):
+                return first
+    return None
+
+
+@lru_cache(maxsize=512, typed=True)
+def _fmt_weight_cached(val: Any, unit: Any) -> str:
+    if val == "" and unit == "":
+        return ""
+    return f"{val} {unit}".strip()
+
+
+def fmt_weight(w: Any) -> str:
+    if isinstance(w, dict):
+        val = w.get("value", "")
+        unit = w.get("unit", "")
+        try:
+            return _fmt_weight_cached(val, unit)
+        except TypeError:
+            # value/unit no hasheables (no debería pasar con la API)
+            return _fmt_weight_cached.__wrapped__(val, unit)
+    return str(w or "")
+
+
+def count_list(x: Any) -> str:
+    if isinstance(x, list):
+        return str(len(x))
+    return "0" if x is None else str(x)
+
+
+def ref_id(obj: Any) -> Any:
+    # Objetos relacionados (warehouse, merchant, brand) vienen como {"id": ...}
+    return obj.get("id") if isinstance(obj, dict) else ""
+
+
+def get_links(obj: Any) -> Dict[str, str]:
+    if isinstance(obj, dict):
+        links = obj.get("links")
+        if isinstance(links, dict):
+            # Convertimos a str por seguridad
+            return {str(k): str(v) for k, v in links.items()}
+    return {}